@@ -6,8 +6,227 @@ import sys
 import argparse
 import mido
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from tqdm import tqdm
 
+def scan_midis(root):
+    """基于os.scandir递归遍历目录，逐个返回MIDI文件路径"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        # 与os.walk一致，跳过无法读取的目录
+        try:
+            it = os.scandir(directory)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(('.mid', '.midi')):
+                    yield entry.path
+
+# 三轨格式的轨道名称，轨道0为鼓，轨道1为主旋律，轨道2为贝斯
+TRIO_TRACK_NAMES = ["Drums", "Melody", "Bass"]
+
+def _load(midi_file_path):
+    """加载MIDI文件，按latin-1解码元信息文本，并截断超出范围的数据字节而不是报错"""
+    return mido.MidiFile(midi_file_path, charset='latin-1', clip=True)
+
+def _read_bytes(midi_file_path):
+    """读取MIDI文件的原始字节"""
+    with open(midi_file_path, 'rb') as f:
+        return f.read()
+
+def _count_tracks(raw):
+    """统计原始MIDI字节中的MTrk块数量"""
+    if raw[:4] != b'MThd':
+        raise ValueError("MThd not found. Probably not a MIDI file")
+    pos = 0
+    track_count = 0
+    while pos + 8 <= len(raw):
+        if raw[pos:pos + 4] == b'MTrk':
+            track_count += 1
+        pos += 8 + int.from_bytes(raw[pos + 4:pos + 8], 'big')
+    return track_count
+
+def _read_vlq(data, pos):
+    """从pos处读取变长整数，返回(数值, 新位置)"""
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+def _encode_vlq(value):
+    """将整数编码为MIDI变长整数"""
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        out.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(out)
+
+def _patch_track_bytes(data, name, is_drum):
+    """
+    逐事件扫描单个MTrk块的数据，替换所有track_name为name；is_drum时把通道消息的通道改为9
+    
+    Raises:
+        ValueError/IndexError: 遇到无法按字节处理的事件（如截断的数据、超出范围的数据字节）
+    """
+    encoded_name = name.encode('latin-1')
+    name_event = b'\xff\x03' + _encode_vlq(len(encoded_name)) + encoded_name
+    out = bytearray()
+    name_written = False
+    running_status = None
+    pos = 0
+    while pos < len(data):
+        # delta time原样保留
+        delta_start = pos
+        _, pos = _read_vlq(data, pos)
+        out += data[delta_start:pos]
+        status = data[pos]
+        if status == 0xFF:
+            # 元事件: FF <type> <len> <data>
+            length, data_start = _read_vlq(data, pos + 2)
+            end = data_start + length
+            if end > len(data):
+                raise ValueError("元事件数据被截断")
+            if data[pos + 1] == 0x03:
+                out += name_event
+                name_written = True
+            else:
+                out += data[pos:end]
+            pos = end
+        elif status in (0xF0, 0xF7):
+            # 系统独占消息: F0/F7 <len> <data>
+            length, data_start = _read_vlq(data, pos + 1)
+            end = data_start + length
+            if end > len(data):
+                raise ValueError("系统独占消息数据被截断")
+            out += data[pos:end]
+            pos = end
+        else:
+            if status & 0x80:
+                if status >= 0xF0:
+                    raise ValueError(f"不支持的状态字节: {status:#x}")
+                running_status = status
+                # 如果是鼓轨，改为通道9以保留is_drum语义（Magenta会按通道9识别鼓）
+                out.append((status & 0xF0) | 0x09 if is_drum else status)
+                pos += 1
+            elif running_status is None:
+                raise ValueError("缺少状态字节")
+            # 音色切换和通道压力只有1个数据字节，其余通道消息有2个
+            end = pos + (1 if (running_status & 0xF0) in (0xC0, 0xD0) else 2)
+            if end > len(data) or any(b & 0x80 for b in data[pos:end]):
+                raise ValueError("通道消息数据无效")
+            out += data[pos:end]
+            pos = end
+    # 如果没有track_name事件，补一个
+    if not name_written:
+        out[0:0] = b'\x00' + name_event
+    return bytes(out)
+
+def _patch_trio_bytes(raw):
+    """
+    直接在原始字节上完成三轨转换，不构造任何MIDI消息对象
+    
+    Args:
+        raw: 三轨MIDI文件的原始字节
+        
+    Returns:
+        转换后的MIDI文件字节
+    """
+    if raw[:4] != b'MThd':
+        raise ValueError("MThd not found. Probably not a MIDI file")
+    pos = 8 + int.from_bytes(raw[4:8], 'big')
+    out = bytearray(raw[:pos])
+    track_idx = 0
+    while pos < len(raw):
+        chunk_type = raw[pos:pos + 4]
+        length = int.from_bytes(raw[pos + 4:pos + 8], 'big')
+        body = raw[pos + 8:pos + 8 + length]
+        if len(body) != length:
+            raise ValueError("MIDI块数据被截断")
+        pos += 8 + length
+        if chunk_type == b'MTrk':
+            if track_idx >= len(TRIO_TRACK_NAMES):
+                raise ValueError("轨道数量超过3")
+            body = _patch_track_bytes(body, TRIO_TRACK_NAMES[track_idx], is_drum=(track_idx == 0))
+            track_idx += 1
+        # 更新块长度
+        out += chunk_type + len(body).to_bytes(4, 'big') + body
+    if track_idx != len(TRIO_TRACK_NAMES):
+        raise ValueError(f"轨道数量不是3: {track_idx}")
+    return bytes(out)
+
+def _get_output_path(midi_file_path, output_dir=None):
+    """确定输出文件路径，输出目录默认为原文件同目录下的trio_midis子目录"""
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(midi_file_path), 'trio_midis')
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, os.path.basename(midi_file_path))
+
+def _transform_and_save(midi_data, midi_file_path, output_dir=None, verbose=True):
+    """
+    将已加载的三轨MIDI重命名为鼓/主旋律/贝斯并保存，避免重复解析文件（会直接修改midi_data）
+    
+    Args:
+        midi_data: 已加载的mido.MidiFile对象
+        midi_file_path: 原MIDI文件路径，用于确定输出文件名
+        output_dir: 输出目录，默认为原文件同目录下的trio_midis子目录
+        verbose: 是否显示详细信息
+        
+    Returns:
+        输出文件路径
+    """
+    # 直接在原MIDI对象上重命名三轨，不重建轨道和消息
+    for i, track in enumerate(midi_data.tracks):
+        # 标记是否已有track_name
+        name_written = False
+        for msg in track:
+            if msg.type == 'track_name':
+                # 用新名字替换
+                msg.name = TRIO_TRACK_NAMES[i]
+                name_written = True
+            # 如果是第0轨，且msg有channel属性，改为通道9以保留is_drum语义（mido本身不支持is_drum，但Magenta会按通道9识别鼓）
+            elif i == 0 and hasattr(msg, 'channel') and msg.channel != 9:
+                msg.channel = 9
+        # 如果没有track_name事件，补一个
+        if not name_written:
+            track.insert(0, mido.MetaMessage('track_name', name=TRIO_TRACK_NAMES[i], time=0))
+        if verbose:
+            print(f"轨道 {i}: 设为 {TRIO_TRACK_NAMES[i]}")
+    output_path = _get_output_path(midi_file_path, output_dir)
+    midi_data.save(output_path)
+    if verbose:
+        print(f"已转换为三轨MIDI文件并保存: {output_path}")
+    return output_path
+
+def _save_trio(raw, midi_file_path, output_dir=None, verbose=True):
+    """
+    将三轨MIDI的原始字节转换并保存，优先使用字节级转换，无法处理时回退到mido
+    
+    Returns:
+        输出文件路径
+    """
+    try:
+        data = _patch_trio_bytes(raw)
+    except (ValueError, IndexError):
+        return _transform_and_save(_load(midi_file_path), midi_file_path, output_dir, verbose)
+    if verbose:
+        for i, name in enumerate(TRIO_TRACK_NAMES):
+            print(f"轨道 {i}: 设为 {name}")
+    output_path = _get_output_path(midi_file_path, output_dir)
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    if verbose:
+        print(f"已转换为三轨MIDI文件并保存: {output_path}")
+    return output_path
+
 def convert_to_trio(midi_file_path, output_dir=None, verbose=True):
     """
     将MIDI文件转换为三轨道格式，轨道0为鼓，轨道1为主旋律，轨道2为贝斯，仅修改轨道信息，保留所有MIDI事件
@@ -21,9 +240,9 @@ def convert_to_trio(midi_file_path, output_dir=None, verbose=True):
         输出文件路径
     """
     try:
-        # 加载MIDI文件
-        midi_data = mido.MidiFile(midi_file_path)
-        track_count = len(midi_data.tracks)
+        # 读取MIDI文件
+        raw = _read_bytes(midi_file_path)
+        track_count = _count_tracks(raw)
         if verbose:
             print(f"\n处理MIDI文件: {os.path.basename(midi_file_path)}")
             print(f"原始轨道数量: {track_count}")
@@ -31,45 +250,33 @@ def convert_to_trio(midi_file_path, output_dir=None, verbose=True):
             if verbose:
                 print(f"轨道数量不是3，无法处理: {track_count}")
             return None
-        # 新建MIDI文件
-        new_midi = mido.MidiFile(ticks_per_beat=midi_data.ticks_per_beat)
-        # 复制三轨并重命名
-        track_names = ["Drums", "Melody", "Bass"]
-        for i, track in enumerate(midi_data.tracks):
-            new_track = mido.MidiTrack()
-            # 标记是否已写入track_name
-            name_written = False
-            for msg in track:
-                if msg.type == 'track_name':
-                    # 用新名字替换
-                    new_track.append(mido.MetaMessage('track_name', name=track_names[i], time=msg.time))
-                    name_written = True
-                else:
-                    # 如果是第0轨，且msg有channel属性且msg.channel==9，保留is_drum语义（mido本身不支持is_drum，但Magenta会按通道9识别鼓）
-                    if i == 0 and hasattr(msg, 'channel'):
-                        msg = msg.copy(channel=9)
-                    new_track.append(msg)
-            # 如果没有track_name事件，补一个
-            if not name_written:
-                new_track.insert(0, mido.MetaMessage('track_name', name=track_names[i], time=0))
-            new_midi.tracks.append(new_track)
-            if verbose:
-                print(f"轨道 {i}: 设为 {track_names[i]}")
-        # 输出目录
-        if output_dir is None:
-            output_dir = os.path.join(os.path.dirname(midi_file_path), 'trio_midis')
-        os.makedirs(output_dir, exist_ok=True)
-        filename = os.path.basename(midi_file_path)
-        output_path = os.path.join(output_dir, filename)
-        new_midi.save(output_path)
-        if verbose:
-            print(f"已转换为三轨MIDI文件并保存: {output_path}")
-        return output_path
+        return _save_trio(raw, midi_file_path, output_dir, verbose)
     except Exception as e:
         if verbose:
             print(f"处理文件 {midi_file_path} 时出错: {str(e)}")
         return None
 
+def _convert_one(midi_file, output_dir):
+    """
+    批量转换的单文件任务，在子进程中执行
+
+    Returns:
+        (状态, 文件路径, 错误信息)，状态为'converted'、'skipped'或'error'
+    """
+    # 检查文件轨道数量
+    try:
+        raw = _read_bytes(midi_file)
+        track_count = _count_tracks(raw)
+        # 只要轨道数为3，直接重命名重排；轨道数大于3的仍可按需处理（此处只处理3轨）
+        if track_count == 3:
+            # 复用已读取的字节，每个文件只读取一次
+            _save_trio(raw, midi_file, output_dir, verbose=False)
+            return 'converted', midi_file, None
+        # 可选：如需处理多轨（track_count > 3），按原有逻辑
+        return 'skipped', midi_file, None
+    except Exception as e:
+        return 'error', midi_file, str(e)
+
 def batch_convert_to_trio(input_dir, output_dir=None, copy_originals=False):
     """
     批量转换目录下所有MIDI文件为三轨道格式
@@ -87,11 +294,7 @@ def batch_convert_to_trio(input_dir, output_dir=None, copy_originals=False):
     os.makedirs(output_dir, exist_ok=True)
     
     # 获取所有MIDI文件
-    midi_files = []
-    for root, dirs, files in os.walk(input_dir):
-        for file in files:
-            if file.lower().endswith(('.mid', '.midi')):
-                midi_files.append(os.path.join(root, file))
+    midi_files = list(scan_midis(input_dir))
     
     if not midi_files:
         print(f"在 {input_dir} 中没有找到MIDI文件")
@@ -105,26 +308,22 @@ def batch_convert_to_trio(input_dir, output_dir=None, copy_originals=False):
     error_count = 0
     copied_count = 0
     
-    # 使用tqdm显示进度条
-    for midi_file in tqdm(midi_files, desc="转换MIDI文件"):
-        # 检查文件轨道数量
-        try:
-            midi_data = mido.MidiFile(midi_file)
-            track_count = len(midi_data.tracks)
-            # 只要轨道数为3，直接重命名重排；轨道数大于3的仍可按需处理（此处只处理3轨）
-            if track_count == 3:
-                result = convert_to_trio(midi_file, output_dir, verbose=False)
-                if result:
-                    converted_count += 1
-                else:
-                    error_count += 1
-            elif track_count > 3:
-                # 可选：如需处理多轨，按原有逻辑
-                skipped_count += 1
-            else:
-                skipped_count += 1
-        except Exception as e:
-            print(f"处理文件 {midi_file} 时出错: {str(e)}")
+    # 各文件相互独立，使用多进程并行转换，tqdm显示进度条
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = list(tqdm(
+            executor.map(partial(_convert_one, output_dir=output_dir), midi_files, chunksize=16),
+            total=len(midi_files),
+            desc="转换MIDI文件"
+        ))
+    
+    for status, midi_file, error in results:
+        if status == 'converted':
+            converted_count += 1
+        elif status == 'skipped':
+            skipped_count += 1
+        else:
+            if error:
+                print(f"处理文件 {midi_file} 时出错: {error}")
             error_count += 1
     
     # 输出转换结果
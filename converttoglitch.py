@@ -1,20 +1,70 @@
 import os
-import random
 import pretty_midi
 import numpy as np
 import argparse
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
 
-def add_extreme_pitch_bends(inst, note, base_time, duration):
-    """在音符周围添加完全随机的弯音效果"""
-    # 在音符持续时间内随机添加5-15个弯音事件
-    num_bends = random.randint(5, 15)
-    for _ in range(num_bends):
-        # 完全随机的时间点
-        t = random.uniform(base_time, base_time + duration)
-        # 创建剧烈的弯音变化，使用更多的极端值组合
-        pitch = random.choice([-8192, -6000, -4096, -2048, 0, 2048, 4096, 6000, 8191])
-        inst.pitch_bends.append(pretty_midi.PitchBend(pitch=pitch, time=t))
+# 可选：使用Numba JIT编译弯音事件生成，未安装时回退到NumPy实现
+try:
+    from numba import njit
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+# 全局共享的NumPy随机数生成器（PCG64），子进程中会重新创建
+_RNG = np.random.default_rng()
+
+def _randint(low, high):
+    """返回闭区间[low, high]内的随机整数，与random.randint语义一致"""
+    return int(_RNG.integers(low, high + 1))
+
+# 剧烈弯音变化的取值，使用更多的极端值组合
+PITCH_BEND_VALUES = np.array([-8192, -6000, -4096, -2048, 0, 2048, 4096, 6000, 8191], dtype=np.int32)
+
+def _gen_bend_arrays_numpy(starts, durations, values):
+    """为每个音符生成5-15个弯音事件，返回展平后的时间和弯音值数组"""
+    counts = _RNG.integers(5, 16, len(starts))
+    total = int(counts.sum())
+    times = np.repeat(starts, counts) + _RNG.random(total) * np.repeat(durations, counts)
+    pitches = _RNG.choice(values, total)
+    return times, pitches
+
+if _HAS_NUMBA:
+    @njit(cache=True)
+    def _gen_bend_arrays_numba(starts, durations, values, seed):
+        """_gen_bend_arrays_numpy的JIT版本，Numba使用独立的随机数状态，需显式播种"""
+        np.random.seed(seed)
+        n = starts.shape[0]
+        counts = np.empty(n, np.int64)
+        total = 0
+        for i in range(n):
+            counts[i] = np.random.randint(5, 16)
+            total += counts[i]
+        times = np.empty(total, np.float64)
+        pitches = np.empty(total, np.int32)
+        k = 0
+        for i in range(n):
+            for _ in range(counts[i]):
+                times[k] = starts[i] + np.random.random() * durations[i]
+                pitches[k] = values[np.random.randint(0, values.shape[0])]
+                k += 1
+        return times, pitches
+
+def add_extreme_pitch_bends(inst, starts, durations):
+    """在一组音符周围批量添加完全随机的弯音效果，每个音符持续时间内5-15个弯音事件"""
+    starts = np.asarray(starts, dtype=np.float64)
+    durations = np.asarray(durations, dtype=np.float64)
+    if starts.size == 0:
+        return
+    if _HAS_NUMBA:
+        # 从全局随机数生成器派生种子，使子进程的重新播种同样作用于JIT内核
+        seed = int(_RNG.integers(0, 2**31 - 1))
+        times, pitches = _gen_bend_arrays_numba(starts, durations, PITCH_BEND_VALUES, seed)
+    else:
+        times, pitches = _gen_bend_arrays_numpy(starts, durations, PITCH_BEND_VALUES)
+    inst.pitch_bends.extend(map(pretty_midi.PitchBend, pitches.tolist(), times.tolist()))
 
 def add_extreme_controls(inst, start_time, end_time):
     """添加剧烈和随机的控制器变化"""
@@ -32,106 +82,122 @@ def add_extreme_controls(inst, start_time, end_time):
     ]
     
     # 随机选择要使用的控制器数量
-    num_controllers = random.randint(3, len(controllers))
-    selected_controllers = random.sample(controllers, num_controllers)
+    num_controllers = _randint(3, len(controllers))
+    selected = _RNG.choice(len(controllers), num_controllers, replace=False)
+    selected_controllers = [controllers[i] for i in selected.tolist()]
 
     # 为每个选中的控制器添加多个随机变化
     for ctrl_num, value_range in selected_controllers:
         # 每个控制器添加2-8个随机变化
-        num_changes = random.randint(2, 8)
-        for _ in range(num_changes):
-            t = random.uniform(start_time, end_time)
-            # 有50%的概率使用极端值，50%的概率使用随机值
-            if random.random() < 0.5:
-                value = random.choice(value_range)
-            else:
-                value = random.randint(min(value_range), max(value_range))
-            inst.control_changes.append(
-                pretty_midi.ControlChange(number=ctrl_num, value=value, time=t)
-            )
+        num_changes = _randint(2, 8)
+        times = _RNG.uniform(start_time, end_time, num_changes)
+        # 有50%的概率使用极端值，50%的概率使用随机值
+        use_extreme = _RNG.random(num_changes) < 0.5
+        values = np.where(
+            use_extreme,
+            _RNG.choice(value_range, num_changes),
+            _RNG.integers(min(value_range), max(value_range) + 1, num_changes)
+        )
+        inst.control_changes.extend(
+            pretty_midi.ControlChange(number=ctrl_num, value=int(v), time=float(t))
+            for v, t in zip(values, times)
+        )
 
-def add_random_effects(inst, note):
-    """为单个音符添加随机效果"""
-    # 获取音符的时间范围
-    start_time = note.start
-    end_time = note.end
-    duration = end_time - start_time
-    
-    # 随机决定是否添加每种效果
-    effects = []
-    if random.random() < 0.3:  # 30%概率添加弯音
-        effects.append(lambda: add_extreme_pitch_bends(inst, note, start_time, duration))
-    if random.random() < 0.3:  # 30%概率添加控制器变化
-        effects.append(lambda: add_extreme_controls(inst, start_time, end_time))
-    
-    # 随机打乱效果的执行顺序
-    random.shuffle(effects)
-    for effect in effects:
-        effect()
-
-def glitch_note(note):
-    """对单个音符进行glitch处理"""
-    # 随机改变音符长度（通过修改end时间）
-    if random.random() < 0.4:
-        duration = note.end - note.start
-        new_duration = duration * random.choice([0.25, 0.5, 1.5, 2.0])
-        note.end = note.start + new_duration
-    
-    # 随机改变起始时间
-    if random.random() < 0.3:
-        shift = random.uniform(-0.1, 0.1)
-        note.start += shift
-        note.end += shift
-    
-    # 随机改变力度
-    if random.random() < 0.5:
-        note.velocity = random.choice([0, 127, random.randint(30, 120)])
-
-def process_midi_file(input_path, output_path):
-    """处理单个MIDI文件"""
-    try:
+def _glitch_midi_file(input_path, output_path, verbose=True):
+    """处理单个MIDI文件，出错时抛出异常"""
     # 加载MIDI文件
     pm = pretty_midi.PrettyMIDI(input_path)
+    if verbose:
         print(f"成功加载MIDI文件，包含 {len(pm.instruments)} 个音轨")
     
     # 对每个音轨进行处理
     for inst in pm.instruments:
-            # 1. 随机删除音符（更高的删除概率）
-            delete_prob = 0.6  # 提高删除概率
-        kept_notes = []
-        for note in inst.notes:
-            if random.random() > delete_prob:
-                kept_notes.append(note)
-        inst.notes = kept_notes
+        # 1. 随机删除音符（更高的删除概率）
+        delete_prob = 0.6  # 提高删除概率
+        keep = _RNG.random(len(inst.notes)) > delete_prob
+        inst.notes = [inst.notes[i] for i in np.flatnonzero(keep).tolist()]
         
-            # 2. 处理每个保留的音符
-        for note in inst.notes:
-                # 对音符进行glitch处理
-                glitch_note(note)
-                # 添加随机效果
-                add_random_effects(inst, note)
+        # 2. 单次遍历处理每个保留的音符：预先为每个音符抽取5个随机数，
+        #    分别决定是否改变长度、起始时间、力度，以及是否添加弯音、控制器变化
+        rolls = _RNG.random((len(inst.notes), 5)).tolist()
+        bend_starts = []
+        bend_durations = []
+        for note, (r_length, r_shift, r_velocity, r_bend, r_control) in zip(inst.notes, rolls):
+            # 随机改变音符长度（通过修改end时间）
+            if r_length < 0.4:
+                duration = note.end - note.start
+                note.end = note.start + duration * float(_RNG.choice([0.25, 0.5, 1.5, 2.0]))
+            
+            # 随机改变起始时间
+            if r_shift < 0.3:
+                shift = _RNG.uniform(-0.1, 0.1)
+                note.start += shift
+                note.end += shift
             
-            # 3. 在关键位置插入全部音符关闭事件
-            if inst.notes:
-                track_start = min(n.start for n in inst.notes)
-                track_end = max(n.end for n in inst.notes)
-                
-                # 随机插入2-5次全部音符关闭
-                for _ in range(random.randint(2, 5)):
-                    t = random.uniform(track_start, track_end)
-                    for cc in range(120, 127):
-                        inst.control_changes.append(
-                            pretty_midi.ControlChange(number=cc, value=0, time=t)
-                        )
+            # 随机改变力度
+            if r_velocity < 0.5:
+                note.velocity = int(_RNG.choice([0, 127, _randint(30, 120)]))
+            
+            # 随机添加效果，两种效果写入不同的事件列表，执行顺序无关
+            start_time = note.start
+            end_time = note.end
+            if r_bend < 0.3:  # 30%概率添加弯音，收集后统一批量生成
+                bend_starts.append(start_time)
+                bend_durations.append(end_time - start_time)
+            if r_control < 0.3:  # 30%概率添加控制器变化
+                add_extreme_controls(inst, start_time, end_time)
+        
+        # 为选中的音符一次性生成全部弯音事件
+        add_extreme_pitch_bends(inst, bend_starts, bend_durations)
+        
+        # 3. 在关键位置插入全部音符关闭事件
+        if inst.notes:
+            track_start = min(n.start for n in inst.notes)
+            track_end = max(n.end for n in inst.notes)
+            
+            # 随机插入2-5次全部音符关闭（CC 120-126），一次性批量追加
+            ControlChange = pretty_midi.ControlChange
+            times = _RNG.uniform(track_start, track_end, _randint(2, 5))
+            inst.control_changes.extend(
+                ControlChange(number=cc, value=0, time=float(t))
+                for t in times for cc in range(120, 127)
+            )
     
-        # 保存处理后的MIDI
+    # 保存处理后的MIDI
     pm.write(output_path)
-    print(f"已生成故障风格MIDI: {output_path}")
-        return True
+    if verbose:
+        print(f"已生成故障风格MIDI: {output_path}")
+    return True
+
+def process_midi_file(input_path, output_path, verbose=True):
+    """处理单个MIDI文件"""
+    try:
+        return _glitch_midi_file(input_path, output_path, verbose)
     except Exception as e:
-        print(f"处理文件时发生错误: {e}")
+        if verbose:
+            print(f"处理文件时发生错误: {e}")
         return False
 
+def _init_worker():
+    """子进程初始化：重新创建随机数生成器，避免fork出的进程共享同一随机序列"""
+    global _RNG
+    _RNG = np.random.default_rng()
+
+def _glitch_one(job):
+    """
+    并行处理的单文件任务
+
+    Returns:
+        (是否成功, 输入文件路径, 错误信息)
+    """
+    input_path, output_path = job
+    try:
+        _glitch_midi_file(input_path, output_path, verbose=False)
+        return True, input_path, None
+    except Exception as e:
+        # 部分异常（如EOFError）没有消息，附带异常类型便于定位
+        return False, input_path, f"{type(e).__name__}: {e}"
+
 def main():
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description='将MIDI文件转换为Glitch风格')
@@ -156,10 +222,23 @@ def main():
                         midi_files.append(main_midi)
         
         print(f"在输入目录中找到 {len(midi_files)} 个主MIDI文件")
+        jobs = []
         for input_path in midi_files:
             filename = os.path.basename(input_path)
             output_path = os.path.join(output_dir, filename.replace(".mid", "_glitch.mid"))
-            process_midi_file(input_path, output_path)
+            jobs.append((input_path, output_path))
+        
+        # 各文件相互独立，使用多进程并行处理
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_worker) as executor:
+            results = list(tqdm(executor.map(_glitch_one, jobs, chunksize=4), total=len(jobs), desc="生成Glitch MIDI"))
+        
+        success_count = 0
+        for ok, input_path, error in results:
+            if ok:
+                success_count += 1
+            else:
+                print(f"处理文件 {input_path} 时发生错误: {error}")
+        print(f"成功处理: {success_count}，处理失败: {len(results) - success_count}")
     
     elif args.input:
         # 单文件处理模式
@@ -4,19 +4,62 @@
 提取MIDI文件中的旋律轨道
 """
 import os
+import re
 import sys
 import shutil
-import pretty_midi
 import numpy as np
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+from convert_to_trio import scan_midis
+
+# 优先使用C++实现的symusic解析MIDI，未安装时回退到pretty_midi
+try:
+    from symusic import Score, Tempo, TimeSignature, Track
+    _HAS_SYMUSIC = True
+except ImportError:
+    import pretty_midi
+    _HAS_SYMUSIC = False
+
+# 旋律轨道名称关键词
+_MEL_RE = re.compile(r'melody|旋律|主题|主奏|solo|lead|main', re.IGNORECASE)
 
 def ensure_dir(directory):
     """确保目录存在，如果不存在则创建"""
-    if not os.path.exists(directory):
-        print(f"创建目录: {directory}")
-        os.makedirs(directory)
+    os.makedirs(directory, exist_ok=True)
+
+def _load_midi(input_file):
+    """加载MIDI文件，时间单位为秒"""
+    if _HAS_SYMUSIC:
+        return Score.from_file(input_file, ttype="second")
+    return pretty_midi.PrettyMIDI(input_file)
+
+def _is_score(midi_data):
+    """判断MIDI对象是symusic的Score还是pretty_midi的PrettyMIDI"""
+    return _HAS_SYMUSIC and isinstance(midi_data, Score)
+
+def _get_instruments(midi_data):
+    """获取MIDI对象中的所有轨道"""
+    if _is_score(midi_data):
+        return midi_data.tracks
+    return midi_data.instruments
 
-def identify_melody_track(midi_data):
+def _get_end_time(midi_data):
+    """获取MIDI对象的总时长（秒）"""
+    if _is_score(midi_data):
+        return midi_data.end()
+    return midi_data.get_end_time()
+
+def _get_pitches(instrument):
+    """获取轨道中所有音符的音高"""
+    if hasattr(instrument.notes, 'numpy'):
+        # symusic的音符以结构数组存储，可直接取出音高列
+        return instrument.notes.numpy()['pitch'].astype(np.int16)
+    notes = instrument.notes
+    return np.fromiter((note.pitch for note in notes), dtype=np.int16, count=len(notes))
+
+def identify_melody_track(midi_data, verbose=True):
     """
     识别MIDI文件中最可能是旋律的轨道
     
@@ -28,11 +71,15 @@ def identify_melody_track(midi_data):
     """
     # 收集每个轨道的信息
     track_info = []
-    melody_keywords = ["melody", "旋律", "主题", "主奏", "solo", "lead", "main"]
+    # 总时长需扫描全部音符，只计算一次
+    total_duration = _get_end_time(midi_data)
     
-    for i, instrument in enumerate(midi_data.instruments):
+    for i, instrument in enumerate(_get_instruments(midi_data)):
+        n = len(instrument.notes)
+        name = instrument.name
+        
         # 跳过空轨道
-        if len(instrument.notes) == 0:
+        if n == 0:
             continue
             
         # 跳过打击乐轨道
@@ -40,32 +87,25 @@ def identify_melody_track(midi_data):
             continue
             
         # 计算音符密度
-        total_duration = midi_data.get_end_time()
-        note_density = len(instrument.notes) / total_duration if total_duration > 0 else 0
+        note_density = n / total_duration if total_duration > 0 else 0.0
         
         # 计算平均音高
-        pitches = [note.pitch for note in instrument.notes]
-        avg_pitch = sum(pitches) / len(pitches) if pitches else 0
+        pitches = _get_pitches(instrument)
+        avg_pitch = float(pitches.mean()) if pitches.size > 0 else 0
         
         # 计算音高变化率
-        pitch_changes = [abs(pitches[i] - pitches[i-1]) for i in range(1, len(pitches))]
-        avg_pitch_change = sum(pitch_changes) / len(pitch_changes) if pitch_changes else 0
+        avg_pitch_change = float(np.abs(np.diff(pitches)).mean()) if pitches.size > 1 else 0.0
         
         # 检查轨道名称是否包含旋律关键词
-        name_score = 0
-        name_lower = instrument.name.lower() if instrument.name else ""
-        for keyword in melody_keywords:
-            if keyword.lower() in name_lower:
-                name_score = 10  # 给予很高的初始分数
-                break
+        name_score = 10 if name and _MEL_RE.search(name) else 0  # 给予很高的初始分数
         
         # 收集轨道信息
         track_info.append({
             'index': i,
-            'name': instrument.name,
+            'name': name,
             'program': instrument.program,
             'is_drum': instrument.is_drum,
-            'num_notes': len(instrument.notes),
+            'num_notes': n,
             'note_density': note_density,
             'avg_pitch': avg_pitch,
             'avg_pitch_change': avg_pitch_change,
@@ -77,14 +117,12 @@ def identify_melody_track(midi_data):
         return None
         
     # 分数计算：为每个特征赋权重
-    max_density = max(t['note_density'] for t in track_info) if track_info else 1
+    max_density = float(np.array([t['note_density'] for t in track_info]).max())
     
     # 修复：避免NumPy数组条件判断
-    has_pitch_change = any(t.get('avg_pitch_change', 0) > 0 for t in track_info)
-    if has_pitch_change:
-        max_pitch_change = max(t.get('avg_pitch_change', 0) for t in track_info if t.get('avg_pitch_change', 0) > 0)
-    else:
-        max_pitch_change = 1
+    pitch_changes = np.array([t['avg_pitch_change'] for t in track_info])
+    pitch_changes = pitch_changes[pitch_changes > 0]
+    max_pitch_change = float(pitch_changes.max()) if pitch_changes.size > 0 else 1
     
     for track in track_info:
         # 名称分数已经在上面计算
@@ -100,7 +138,8 @@ def identify_melody_track(midi_data):
         melody_score = track['name_score'] + density_score + pitch_score + change_score
         track['melody_score'] = melody_score
         
-        print(f"轨道 {track['index']}: {track['name']} - 分数: {melody_score:.2f} (名称:{track['name_score']:.1f}, 密度:{density_score:.2f}, 音高:{pitch_score:.2f}, 变化:{change_score:.2f})")
+        if verbose:
+            print(f"轨道 {track['index']}: {track['name']} - 分数: {melody_score:.2f} (名称:{track['name_score']:.1f}, 密度:{density_score:.2f}, 音高:{pitch_score:.2f}, 变化:{change_score:.2f})")
     
     # 按旋律可能性评分排序
     track_info.sort(key=lambda x: x['melody_score'], reverse=True)
@@ -108,60 +147,102 @@ def identify_melody_track(midi_data):
     # 返回最有可能是旋律的轨道
     return track_info[0]['instrument'] if track_info else None
 
-def extract_melody(input_file, output_file):
-    """提取MIDI文件中的旋律轨道并保存为新文件"""
-    try:
-        # 加载MIDI文件
-        midi_data = pretty_midi.PrettyMIDI(input_file)
-        
-        # 识别旋律轨道
-        melody_track = identify_melody_track(midi_data)
-        
-        if melody_track is None:
+def _extract_melody(input_file, output_file, verbose=True):
+    """提取MIDI文件中的旋律轨道并保存为新文件，出错时抛出异常"""
+    # 加载MIDI文件
+    midi_data = _load_midi(input_file)
+    
+    # 识别旋律轨道
+    melody_track = identify_melody_track(midi_data, verbose=verbose)
+    
+    if melody_track is None:
+        if verbose:
             print(f"警告：在文件 {input_file} 中没有找到有效的旋律轨道")
-            return False
-            
-        # 创建新的MIDI文件，仅包含旋律轨道
-        tempo_changes = midi_data.get_tempo_changes()
-        # 修复：检查避免索引错误
-        initial_tempo = 120.0  # 默认值
-        if len(tempo_changes) > 1 and len(tempo_changes[1]) > 0:
-            initial_tempo = tempo_changes[1][0]
-            
-        new_midi = pretty_midi.PrettyMIDI(
-            resolution=midi_data.resolution, 
-            initial_tempo=initial_tempo
-        )
-        
-        # 复制旋律轨道
-        new_instrument = pretty_midi.Instrument(
-            program=melody_track.program,
-            is_drum=False,
-            name="Melody"
-        )
-        
-        # 复制音符
-        for note in melody_track.notes:
-            new_instrument.notes.append(pretty_midi.Note(
-                velocity=note.velocity,
-                pitch=note.pitch,
-                start=note.start,
-                end=note.end
-            ))
-            
-        # 添加到新MIDI
-        new_midi.instruments.append(new_instrument)
-        
-        # 保存新文件
-        new_midi.write(output_file)
+        return False
+    
+    if _is_score(midi_data):
+        # 与pretty_midi分支输出一致：仅包含初始速度和旋律轨道的音符。
+        # pretty_midi只把位于0时刻的速度事件作为初始速度，否则使用120 BPM
+        initial_tempo = None
+        for tempo in midi_data.tempos:
+            if tempo.time > 0:
+                break
+            initial_tempo = tempo
+        new_midi = Score(midi_data.ticks_per_quarter, ttype="second")
+        if initial_tempo is None:
+            new_midi.tempos.append(Tempo(0, 120.0, ttype="second"))
+        else:
+            new_midi.tempos.append(initial_tempo.copy())
+        # pretty_midi写文件时总会补一个4/4拍号
+        new_midi.time_signatures.append(TimeSignature(0, 4, 4, ttype="second"))
+        new_instrument = Track(name="Melody", program=melody_track.program, is_drum=False, ttype="second")
+        new_instrument.notes = melody_track.notes.copy()
+        new_midi.tracks.append(new_instrument)
+        new_midi.dump_midi(output_file)
         return True
-        
+    
+    # 创建新的MIDI文件，仅包含旋律轨道
+    tempo_changes = midi_data.get_tempo_changes()
+    # 修复：检查避免索引错误
+    initial_tempo = 120.0  # 默认值
+    if len(tempo_changes) > 1 and len(tempo_changes[1]) > 0:
+        initial_tempo = tempo_changes[1][0]
+    
+    new_midi = pretty_midi.PrettyMIDI(
+        resolution=midi_data.resolution, 
+        initial_tempo=initial_tempo
+    )
+    
+    # 复制旋律轨道
+    new_instrument = pretty_midi.Instrument(
+        program=melody_track.program,
+        is_drum=False,
+        name="Melody"
+    )
+    
+    # 复制音符
+    for note in melody_track.notes:
+        new_instrument.notes.append(pretty_midi.Note(
+            velocity=note.velocity,
+            pitch=note.pitch,
+            start=note.start,
+            end=note.end
+        ))
+    
+    # 添加到新MIDI
+    new_midi.instruments.append(new_instrument)
+    
+    # 保存新文件
+    new_midi.write(output_file)
+    return True
+
+def extract_melody(input_file, output_file, verbose=True):
+    """提取MIDI文件中的旋律轨道并保存为新文件"""
+    try:
+        return _extract_melody(input_file, output_file, verbose)
     except Exception as e:
-        print(f"处理文件 {input_file} 时出错: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        if verbose:
+            print(f"处理文件 {input_file} 时出错: {str(e)}")
+            import traceback
+            traceback.print_exc()
         return False
 
+def _extract_one(paths):
+    """
+    并行处理的单文件任务，子进程中不输出日志以避免争用stdout
+
+    Returns:
+        (是否成功, 输入文件路径, 错误信息)
+    """
+    input_path, output_path = paths
+    try:
+        if _extract_melody(input_path, output_path, verbose=False):
+            return True, input_path, None
+        return False, input_path, "没有找到有效的旋律轨道"
+    except Exception as e:
+        # 部分异常（如EOFError）没有消息，附带异常类型便于定位
+        return False, input_path, f"{type(e).__name__}: {e}"
+
 def process_directory(input_dir, output_dir):
     """处理文件夹中的所有MIDI文件"""
     # 确保输出目录存在
@@ -174,29 +255,34 @@ def process_directory(input_dir, output_dir):
         'failed': 0
     }
     
-    # 遍历输入目录
-    for root, _, files in os.walk(input_dir):
-        for file in files:
-            # 检查是否是MIDI文件
-            if file.lower().endswith(('.mid', '.midi')):
-                stats['total'] += 1
-                
-                # 构建输入路径
-                input_path = os.path.join(root, file)
-                
-                # 构建输出路径，保持目录结构
-                rel_path = os.path.relpath(root, input_dir)
-                output_subdir = os.path.join(output_dir, rel_path)
-                ensure_dir(output_subdir)
-                output_path = os.path.join(output_subdir, file)
-                
-                # 提取旋律轨道
-                print(f"处理: {input_path}")
-                if extract_melody(input_path, output_path):
-                    stats['success'] += 1
-                else:
-                    stats['failed'] += 1
-                    
+    # 遍历输入目录，收集待处理文件；输出子目录在主进程中预先创建，避免并行时竞争
+    jobs = []
+    needed_dirs = set()
+    for input_path in scan_midis(input_dir):
+        # 构建输出路径，保持目录结构
+        rel_path = os.path.relpath(os.path.dirname(input_path), input_dir)
+        output_subdir = os.path.join(output_dir, rel_path)
+        needed_dirs.add(output_subdir)
+        output_path = os.path.join(output_subdir, os.path.basename(input_path))
+        jobs.append((input_path, output_path))
+    
+    # 每个输出子目录只创建一次
+    for directory in needed_dirs:
+        ensure_dir(directory)
+    
+    stats['total'] = len(jobs)
+    
+    # 各文件相互独立，使用多进程并行提取旋律轨道
+    with ProcessPoolExecutor() as executor:
+        results = list(tqdm(executor.map(_extract_one, jobs, chunksize=8), total=len(jobs), desc="提取旋律"))
+    
+    for ok, input_path, error in results:
+        if ok:
+            stats['success'] += 1
+        else:
+            print(f"处理文件 {input_path} 时出错: {error}")
+            stats['failed'] += 1
+    
     # 打印统计信息
     print("\n处理完成!")
     print(f"总文件数: {stats['total']}")
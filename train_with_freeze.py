@@ -1,14 +1,13 @@
 #!/usr/bin/env python
 import os
 import sys
+import logging
 import tensorflow as tf
 import functools
 
-# 导入magenta训练模块和模型模块
+# 导入magenta训练模块
 try:
     from magenta.models.music_vae import music_vae_train as train_script
-    # 新增：导入模型模块，用于冻结层
-    import magenta.models.music_vae.trained_model as trained_model
     print("成功导入Magenta模块")
 except ImportError as e:
     print(f"无法导入Magenta模块: {e}")
@@ -21,6 +20,28 @@ print(f"当前TensorFlow版本: {tf_version}")
 if not tf_version.startswith("2."):
     print("警告: 此版本针对TensorFlow 2.x，您的版本可能不兼容")
 
+# 冻结策略的层名关键词
+ENCODER_FROZEN_KEYS = ("bilstm_0", "rnn_0", "rnn_cell_0")
+DECODER_FROZEN_KEYS = ("core_decoder_0", "output_projection_0", "rnn_cell_0/level_0")
+LATENT_KEYS = ("z_", "latent")
+
+def _build_freeze_table(layer_names):
+    """根据层名一次性计算每层所属类别及是否冻结，返回 {层名: (类别, 是否冻结)}"""
+    table = {}
+    for name in layer_names:
+        if "encoder" in name:
+            # 只冻结编码器的第一层 (可能是bilstm_0, rnn_0等)
+            table[name] = ("encoder", any(k in name for k in ENCODER_FROZEN_KEYS))
+        elif "decoder" in name:
+            # 冻结解码器的基础层
+            table[name] = ("decoder", any(k in name for k in DECODER_FROZEN_KEYS))
+        elif any(k in name for k in LATENT_KEYS):
+            # 保持潜在空间完全可训练
+            table[name] = ("latent", False)
+        else:
+            table[name] = ("other", False)
+    return table
+
 def freeze_layers_for_digiscore(model):
     """为数字乐谱项目冻结特定层 - 适配TensorFlow 2.x
     
@@ -32,82 +53,44 @@ def freeze_layers_for_digiscore(model):
     print("\n数字乐谱(DigiScore)项目 - 冻结层方案:")
     print("---------------------------------------------")
     
-    frozen_count = 0
-    trainable_count = 0
-    
-    # 按类别统计参数
-    encoder_layers = 0
-    decoder_layers = 0
-    latent_layers = 0
-    other_layers = 0
+    freeze_table = _build_freeze_table([layer.name for layer in model.layers])
     
-    # 首先打印所有层以便调试
-    print("模型所有层名:")
-    for i, layer in enumerate(model.layers):
-        print(f"{i}: {layer.name}")
+    # 按类别统计层数
+    category_counts = {"encoder": 0, "decoder": 0, "latent": 0, "other": 0}
+    frozen_names = []
     
     # 遍历所有层，应用冻结策略
     for layer in model.layers:
-        if "encoder" in layer.name:
-            encoder_layers += 1
-            # 只冻结编码器的第一层 (可能是bilstm_0, rnn_0等)
-            if any(x in layer.name for x in ["bilstm_0", "rnn_0", "rnn_cell_0"]):
-                layer.trainable = False
-                frozen_count += 1
-                print(f"已冻结编码器层: {layer.name}")
-            else:
-                trainable_count += 1
-        elif "decoder" in layer.name:
-            decoder_layers += 1
-            # 冻结解码器的基础层
-            if any(x in layer.name for x in ["core_decoder_0", "output_projection_0", "rnn_cell_0/level_0"]):
-                layer.trainable = False
-                frozen_count += 1
-                print(f"已冻结解码器层: {layer.name}")
-            else:
-                trainable_count += 1
-        elif any(x in layer.name for x in ["z_", "latent"]):
-            # 保持潜在空间完全可训练
-            latent_layers += 1
-            trainable_count += 1
-        else:
-            other_layers += 1
-            trainable_count += 1
+        category, frozen = freeze_table[layer.name]
+        category_counts[category] += 1
+        if frozen:
+            layer.trainable = False
+            frozen_names.append(layer.name)
+    
+    frozen_count = len(frozen_names)
+    trainable_count = len(model.layers) - frozen_count
+    
+    # 调试信息统一输出一次，避免逐层打印
+    logging.debug("模型所有层名: %s", ", ".join(freeze_table))
+    logging.debug("已冻结层: %s", ", ".join(frozen_names))
     
     print("\n冻结层统计:")
     print(f"- 总层数: {frozen_count + trainable_count}")
     print(f"- 已冻结: {frozen_count}")
     print(f"- 可训练: {trainable_count}")
-    print(f"- 编码器层: {encoder_layers}")
-    print(f"- 解码器层: {decoder_layers}")
-    print(f"- 潜在空间层: {latent_layers}")
-    print(f"- 其他层: {other_layers}")
+    print(f"- 编码器层: {category_counts['encoder']}")
+    print(f"- 解码器层: {category_counts['decoder']}")
+    print(f"- 潜在空间层: {category_counts['latent']}")
+    print(f"- 其他层: {category_counts['other']}")
     print("---------------------------------------------")
     print("冻结策略：保留低层特征提取能力，同时优化高层特征和MIDI CC控制参数生成")
     print("这种配置最适合在good/bad样本之间进行插值生成数字乐谱\n")
 
 def main():
-    """主函数 - 应用冻结层策略并启动训练"""
-    
-    # 保存原始的TrainedModel.__init__
-    original_init = trained_model.TrainedModel.__init__
-    
-    # 定义新的__init__，添加冻结层逻辑
-    def patched_init(self, *args, **kwargs):
-        # 先调用原始初始化
-        original_init(self, *args, **kwargs)
-        # 确保模型已创建
-        if hasattr(self, '_model'):
-            print("模型已创建，准备应用层冻结...")
-            # 应用我们的冻结逻辑
-            freeze_layers_for_digiscore(self._model)
-        else:
-            print("警告：无法获取模型实例，冻结层失败")
-    
-    # 替换原始__init__，这样每次创建模型时都会自动应用冻结
-    trained_model.TrainedModel.__init__ = patched_init
-    print("已设置DigiScore冻结层钩子...")
+    """主函数 - 启动训练
     
+    注意：训练过程不会冻结任何层，freeze_layers_for_digiscore目前没有接入训练流程。
+    """
     # 启动训练
     print("开始训练...")
     train_script.console_entry_point()